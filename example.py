@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from functools import lru_cache
+from operator import le
 
 
 @dataclass(frozen=True, order=True)
@@ -11,6 +13,11 @@ class Person:
             raise ValueError("Age must be positive")
 
 
+# Persons are immutable, so equal persons can share one instance - shrinking
+# generates the same few names and ages over and over again
+cached_person = lru_cache(maxsize=4096)(Person)
+
+
 def sort_by_age(people: list[Person]) -> list[Person]:
     return sorted(people, key=lambda p: p.age)
 
@@ -21,8 +28,12 @@ def wrong_sort_by_age(people: list[Person]) -> list[Person]:
 
 
 def is_valid(persons_in: list[Person], persons_out: list[Person]) -> bool:
-    same_length = len(persons_in) == len(persons_out)
-    sorted = all(persons_out[i].age <= persons_out[i + 1].age
-                 for i in range(len(persons_out)-1))
-    unchanged = {p.name for p in persons_in} == {p.name for p in persons_out}
-    return all([same_length, sorted, unchanged])
+    # cheapest check first, and stop at the first one which fails - this
+    # runs for every generated value and every shrink candidate
+    if len(persons_in) != len(persons_out):
+        return False
+    # compare neighbouring ages pairwise in C instead of indexing in a loop
+    ages = [p.age for p in persons_out]
+    if not all(map(le, ages, ages[1:])):
+        return False
+    return {p.name for p in persons_in} == {p.name for p in persons_out}
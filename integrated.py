@@ -8,14 +8,13 @@
 # see function tree_mapN
 
 from __future__ import annotations
-from copy import copy
 
-from dataclasses import dataclass, replace
-import itertools
+from dataclasses import dataclass
 import random
-from typing import Any, Callable, Generic, Iterable, Protocol, TypeVar, Union
+from typing import (Any, Callable, Generic, Iterable, Iterator, Optional,
+                    Protocol, TypeVar, Union)
 
-from example import Person, is_valid, sort_by_age, wrong_sort_by_age
+from example import cached_person, is_valid, sort_by_age, wrong_sort_by_age
 
 T = TypeVar("T")
 U = TypeVar("U")
@@ -25,11 +24,33 @@ V = TypeVar("V")
 
 
 class Generator(Generic[T]):
+    __slots__ = ('generate',)
+    generate: Callable[[], T]
+
     def __init__(self, generator: Callable[[], T]):
-        self._generator = generator
+        # store the callable itself, so gen.generate() is a single call
+        self.generate = generator
+
+
+# random.randint is comparatively slow - draw the random numbers for each
+# range in batches and hand them out one by one. The batches are drawn ahead
+# of time, so reseed with seed below to get the same values again.
+_POOL_SIZE = 4096
+_pools: dict[tuple[int, int], list[int]] = {}
+
 
-    def generate(self) -> T:
-        return self._generator()
+def _randint(low: int, high: int) -> int:
+    pool = _pools.get((low, high))
+    if not pool:
+        pool = _pools[(low, high)] = random.choices(range(low, high + 1),
+                                                    k=_POOL_SIZE)
+    return pool.pop()
+
+
+def seed(a: Any = None) -> None:
+    "random.seed(a), and throw away the random numbers drawn ahead of time"
+    random.seed(a)
+    _pools.clear()
 
 
 def gen_sample(gen: Generator[T]) -> list[T]:
@@ -44,16 +65,18 @@ pure = gen_constant
 
 
 def gen_int_between(low: int, high: int) -> Generator[int]:
-    return Generator(lambda: random.randint(low, high))
+    return Generator(lambda: _randint(low, high))
 
 
 def gen_map(f: Callable[[T], U], gen: Generator[T]) -> Generator[U]:
-    return Generator(lambda: f(gen.generate()))
+    generate = gen.generate
+    return Generator(lambda: f(generate()))
 
 
 def gen_mapN(f: Callable[..., T],
              gens: Iterable[Generator[Any]]) -> Generator[T]:
-    return Generator(lambda: f(gen.generate() for gen in gens))
+    generates = tuple(gen.generate for gen in gens)
+    return Generator(lambda: f(generate() for generate in generates))
 
 
 def gen_bind(func: Callable[[T], Generator[U]],
@@ -75,7 +98,7 @@ def shrink_int(low: int, high: int) -> Shrink[int]:
     if high < 0:
         target = high
 
-    def shrinker(value: int) -> Iterable[int]:
+    def halving(value: int) -> Iterable[int]:
         if value == target:
             return
         half = (value - target) // 2
@@ -85,27 +108,51 @@ def shrink_int(low: int, high: int) -> Shrink[int]:
             half = (current - target) // 2
             current = current - half
         yield target
+
+    # the sequence only depends on the value, compute it once per value
+    sequences: dict[int, tuple[int, ...]] = {}
+
+    def shrinker(value: int) -> Iterable[int]:
+        sequence = sequences.get(value)
+        if sequence is None:
+            sequence = sequences[value] = tuple(halving(value))
+        return sequence
     return shrinker
 
 
 # Candidates #####################################################
 
 class CandidateTree(Generic[T]):
+    __slots__ = ('_value', '_source', '_computed')
 
     def __init__(self, value: T,
                  candidates: Iterable[CandidateTree[T]]) -> None:
         self._value = value
-        # return a cached iterator
-        (self._candidates,) = itertools.tee(candidates, 1)
+        # The candidates are computed on demand and kept, so that the
+        # candidates can be iterated again without computing them again - but
+        # only as far as somebody actually looked at them.
+        self._source: Optional[Iterator[CandidateTree[T]]] = iter(candidates)
+        self._computed: list[CandidateTree[T]] = []
 
     @property
     def value(self):
         return self._value
 
     @property
-    def candidates(self):
-        # reset the iterator to the start
-        return copy(self._candidates)
+    def candidates(self) -> Iterator[CandidateTree[T]]:
+        computed = self._computed
+        i = 0
+        while True:
+            if i == len(computed):
+                if self._source is None:
+                    return
+                candidate = next(self._source, None)
+                if candidate is None:
+                    self._source = None  # all candidates are computed
+                    return
+                computed.append(candidate)
+            yield computed[i]
+            i += 1
 
     def __str__(self, level=0):
         ret = "\t"*level+repr(self.value)+"\n"
@@ -118,6 +165,12 @@ class CandidateTree(Generic[T]):
 
 # instead of randomly generating values T we are generating entire trees of T
 
+# All tree functions below are lazy: candidates are generators, so
+# the recursive calls only happen one level at a time when a candidate is
+# actually visited. Apart from CandidateTree.__str__ (meant for small trees)
+# nothing walks a tree eagerly - keep it that way, otherwise the recursion
+# depth grows with the size of the tree.
+
 
 def tree_constant(value: T) -> CandidateTree[T]:
     return CandidateTree(value, tuple())
@@ -133,6 +186,24 @@ def tree_from_shrink(value: T, shrink: Shrink[T]) -> CandidateTree[T]:
     )
 
 
+# Trees never change once their candidates are stored, so the tree of a value
+# can be shared. Small ranges like ages or letters have only a few distinct
+# values which are visited over and over again while shrinking. The trees are
+# kept by the generator of the range and go away with it.
+def _shared_int_trees(shrink: Shrink[int]
+                      ) -> Callable[[int], CandidateTree[int]]:
+    trees: dict[int, CandidateTree[int]] = {}
+
+    def int_tree(value: int) -> CandidateTree[int]:
+        tree = trees.get(value)
+        if tree is None:
+            tree = trees[value] = CandidateTree(
+                value=value,
+                candidates=(int_tree(v) for v in shrink(value)))
+        return tree
+    return int_tree
+
+
 def tree_map(f: Callable[[T], U], tree: CandidateTree[T]) -> CandidateTree[U]:
     return CandidateTree(
         value=f(tree.value),
@@ -147,20 +218,15 @@ def tree_map2(f: Callable[[T, U], V],
 
     value = f(tree_1.value, tree_2.value)
 
-    candidates_1 = (
-        tree_map2(f, candidate, tree_2) for candidate in tree_1.candidates
-    )
-
-    candidates_2 = (
-        tree_map2(f, tree_1, candidate) for candidate in tree_2.candidates
-    )
+    def candidates() -> Iterator[CandidateTree[V]]:
+        for candidate in tree_1.candidates:
+            yield tree_map2(f, candidate, tree_2)
+        for candidate in tree_2.candidates:
+            yield tree_map2(f, tree_1, candidate)
 
     return CandidateTree(
         value=value,
-        candidates=itertools.chain(
-            candidates_1,
-            candidates_2
-        )
+        candidates=candidates()
     )
 
 
@@ -171,16 +237,12 @@ tree_tuples = tree_map2(lambda x, y: (x, y), tree_1, tree_2)
 
 def tree_mapN(f: Callable[..., U],
               trees: Iterable[CandidateTree[Any]]) -> CandidateTree[U]:
-    trees = list(trees)
+    trees = tuple(trees)
     value = f([tree.value for tree in trees])
 
-    def _copy_and_set(trees: list[T], i: int, tree: T) -> list[T]:
-        result = list(trees)
-        result[i] = tree
-        return result
-
+    # the candidate replaces the i-th tree, the other trees are shared
     candidates = (
-        tree_mapN(f, _copy_and_set(trees, i, candidate))
+        tree_mapN(f, trees[:i] + (candidate,) + trees[i+1:])
         for i in range(len(trees))
         for candidate in trees[i].candidates
     )
@@ -195,17 +257,15 @@ def tree_bind(f: Callable[[T], CandidateTree[U]],
               tree: CandidateTree[T]
               ) -> CandidateTree[U]:
     tree_u = f(tree.value)
-    candidates = (
-        tree_bind(f, candidate)
-        for candidate in tree.candidates
-    )
+
+    def candidates() -> Iterator[CandidateTree[U]]:
+        for candidate in tree.candidates:
+            yield tree_bind(f, candidate)
+        yield from tree_u.candidates
 
     return CandidateTree(
         value=tree_u.value,
-        candidates=itertools.chain(
-            candidates,
-            tree_u.candidates
-        )
+        candidates=candidates()
     )
 
 
@@ -236,7 +296,7 @@ constant = always
 
 
 def int_between(low: int, high: int) -> CTGenerator[int]:
-    return gen_map(lambda v: tree_from_shrink(v, shrink_int(low, high)),
+    return gen_map(_shared_int_trees(shrink_int(low, high)),
                    gen_int_between(low, high))
 
 
@@ -266,13 +326,16 @@ def bind(f: Callable[[T], CTGenerator[U]],
 
 
 def list_of(gen: CTGenerator[T]) -> CTGenerator[list[T]]:
-    length = int_between(0, 10)
-    return bind(lambda lst: list_of_length(lst, gen), length)
+    max_length = 10
+    length = int_between(0, max_length)
+    # build the generator for each length once, not again for every list
+    of_length = [list_of_length(n, gen) for n in range(max_length + 1)]
+    return bind(lambda n: of_length[n], length)
 
 
 # Properties ####################################################
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TestResult:
     is_success: bool
     arguments: tuple[Any, ...]
@@ -290,21 +353,27 @@ def for_all(gen: CTGenerator[T],
         else:
             return map(
                 lambda inner_out:  # inner_out: TestResult
-                replace(inner_out, arguments=(value,) + inner_out.arguments),
+                TestResult(inner_out.is_success,
+                           (value,) + inner_out.arguments),
                 outcome)
     return bind(property_wrapper, gen)
 
 
 def test(property: Property):
+    # a loop instead of recursion: one step per smaller failing candidate,
+    # so deep shrinks don't pile up stack frames
     def do_shrink(tree: CandidateTree[TestResult]) -> None:
-        for smaller in tree.candidates:
-            if not smaller.value.is_success:
-                print(f"Shrinking: found smaller arguments {
-                      smaller.value.arguments}")
-                do_shrink(smaller)
-                break
-        else:
-            print(f"Shrinking: gave up at arguments {tree.value.arguments}")
+        while True:
+            for smaller in tree.candidates:
+                if not smaller.value.is_success:
+                    print(f"Shrinking: found smaller arguments {
+                          smaller.value.arguments}")
+                    tree = smaller
+                    break
+            else:
+                print(f"Shrinking: gave up at arguments {
+                      tree.value.arguments}")
+                return
 
     for test_number in range(100):
         result = property.generate()
@@ -330,9 +399,29 @@ age = int_between(0, 100)
 
 letter = map(chr, int_between(ord('a'), ord('z')))
 
-simple_name = map("".join, list_of_length(6, letter))
 
-person = mapN(lambda a: Person(*a), (simple_name, age))
+def fixed_letters(length: int) -> CTGenerator[str]:
+    # same trees as map("".join, list_of_length(length, letter)), but the
+    # letters are drawn at once and the tree of each letter is only built once
+    low, high = ord('a'), ord('z')
+    int_tree = _shared_int_trees(shrink_int(low, high))
+    letter_trees: dict[int, CandidateTree[str]] = {}
+
+    def letter_tree(code: int) -> CandidateTree[str]:
+        tree = letter_trees.get(code)
+        if tree is None:
+            tree = letter_trees[code] = tree_map(chr, int_tree(code))
+        return tree
+
+    def generator() -> CandidateTree[str]:
+        codes = random.choices(range(low, high + 1), k=length)
+        return tree_mapN("".join, [letter_tree(code) for code in codes])
+    return Generator(generator)
+
+
+simple_name = fixed_letters(6)
+
+person = mapN(lambda a: cached_person(*a), (simple_name, age))
 
 lists_of_person = list_of(person)
 
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+from array import array
 import random
-from dataclasses import dataclass, replace
+from dataclasses import dataclass
 from decimal import InvalidOperation
+from functools import lru_cache
 from typing import (Any, Callable, Generic, Iterable,
                     Optional, Tuple, TypeVar, Union)
 
-from example import Person, is_valid, sort_by_age, wrong_sort_by_age
+from example import cached_person, is_valid, sort_by_age, wrong_sort_by_age
 
 T = TypeVar("T")
 U = TypeVar("U")
@@ -17,11 +19,23 @@ class InvalidReplay(Exception):
     pass
 
 
+# the choices are stored in a compact C array of 64 bit ints instead of a
+# list of Python ints - the shrinker copies them for every single candidate
+def make_history(choices: Iterable[int] | bytes = ()) -> array[int]:
+    if isinstance(choices, bytes):
+        history = array('q')
+        history.frombytes(choices)
+        return history
+    return array('q', choices)
+
+
 class ChoiceSeq:
-    def __init__(self, history: Optional[list[int]] = None) -> None:
+    __slots__ = ('_replaying', 'history')
+
+    def __init__(self, history: Optional[array[int]] = None) -> None:
         if history is None:
             self._replaying: Optional[int] = None
-            self.history: list[int] = []
+            self.history: array[int] = make_history()
         else:
             self._replaying = 0
             self.history = history
@@ -51,52 +65,166 @@ class ChoiceSeq:
         return ChoiceSeq(self.history[:self._replaying])
 
 
+# the kinds of generators, see Generator.op and compile_program
+CONST, RANDINT, MAP, MAPN, BIND, CALL = range(6)
+
+
 class Generator(Generic[T]):
-    def __init__(self, generator: Callable[[ChoiceSeq], T]):
-        self._generator = generator
+    __slots__ = ('generate', 'op', '_program')
+    generate: Callable[[ChoiceSeq], T]
 
-    def generate(self, choose: ChoiceSeq) -> T:
-        return self._generator(choose)
+    def __init__(self, generator: Callable[[ChoiceSeq], T],
+                 op: Optional[tuple[Any, ...]] = None):
+        # store the callable itself, so gen.generate(choose) is a single call
+        self.generate = generator
+        # how the generator was built, e.g. (MAP, f, gen) - None for custom
+        # generators which can only be called
+        self.op = op
+        self._program: Optional[Program] = None
 
 
 def sample(gen: Generator[T]) -> list[tuple[T, list[int]]]:
     choose = ChoiceSeq()
-    return [(gen.generate(choose), choose.history) for _ in range(10)]
+    values = [gen.generate(choose) for _ in range(10)]
+    # the packed array is internal to shrinking, show a plain list - like
+    # before, all samples share the history of the whole run
+    history = choose.history.tolist()
+    return [(value, history) for value in values]
 
 
 def constant(value: T) -> Generator[T]:
-    return Generator(lambda _: value)
+    return Generator(lambda _: value, (CONST, value))
 
 
 def int_between(low: int, high: int) -> Generator[int]:
-    return Generator(lambda choose: choose.randint(low, high))
+    return Generator(lambda choose: choose.randint(low, high),
+                     (RANDINT, low, high))
 
 
 def map(f: Callable[[T], U], gen: Generator[T]) -> Generator[U]:
-    return Generator(lambda choose: f(gen.generate(choose)))
+    generate = gen.generate
+    return Generator(lambda choose: f(generate(choose)), (MAP, f, gen))
 
 
 def mapN(f: Callable[..., T], gens: Iterable[Generator[Any]]) -> Generator[T]:
-    return Generator(lambda choose: f(*[gen.generate(choose) for gen in gens]))
+    gens = tuple(gens)
+    generates = tuple(gen.generate for gen in gens)
+    return Generator(lambda choose: f(*[generate(choose)
+                                        for generate in generates]),
+                     (MAPN, f, gens))
 
 
 def bind(f: Callable[[T], Generator[U]], gen: Generator[T]) -> Generator[U]:
-    return Generator(lambda choose: f(gen.generate(choose)).generate(choose))
-
-
-def shrink_int(value: int) -> Iterable[int]:
-    current = abs(value) - 1
+    generate = gen.generate
+    return Generator(lambda choose: f(generate(choose)).generate(choose),
+                     (BIND, f, gen))
+
+
+# Generators as programs ########################################
+
+# A generator can be flattened into a program for a small stack machine:
+# the instructions of the inner generators come first and push their values,
+# MAP and MAPN pop their arguments and push the result. The program makes the
+# same choices in the same order as gen.generate. It isn't run directly, it
+# is compiled to Python code by compile_to_python below.
+
+Instruction = tuple[int, Any]
+Program = list[Instruction]
+
+
+def compile_program(gen: Generator[Any]) -> Program:
+    if gen._program is None:
+        op = gen.op
+        program: Program
+        if op is None:
+            program = [(CALL, gen.generate)]
+        elif op[0] == CONST:
+            program = [(CONST, op[1])]
+        elif op[0] == RANDINT:
+            program = [(RANDINT, (op[1], op[2]))]
+        elif op[0] == MAP:
+            program = compile_program(op[2]) + [(MAP, op[1])]
+        elif op[0] == MAPN:
+            program = []
+            for inner in op[2]:
+                program += compile_program(inner)
+            program.append((MAPN, (op[1], len(op[2]))))
+        else:  # BIND
+            program = compile_program(op[2]) + [(BIND, op[1])]
+        gen._program = program
+    return gen._program
+
+
+def compile_to_python(gen: Generator[T]) -> Callable[[ChoiceSeq], T]:
+    # Turns the program into the source code of a function with one line per
+    # instruction and compiles it, e.g. for mapN(f, [int_between(0, 10)] * 2)
+    #
+    #   def generate(choose):
+    #       randint = choose.randint
+    #       v0 = randint(0, 10)
+    #       v1 = randint(0, 10)
+    #       v2 = k0(v0, v1)
+    #       return v2
+    #
+    # The functions of MAP, MAPN, ... are passed in as k0, k1, ... A bound
+    # generator is only known at runtime, it runs through its own generate.
+    namespace: dict[str, Any] = {}
+    lines = ["def generate(choose):", "    randint = choose.randint"]
+    stack: list[str] = []
+
+    def konst(value: Any) -> str:
+        name = f"k{len(namespace)}"
+        namespace[name] = value
+        return name
+
+    def assign(expression: str) -> None:
+        name = f"v{len(lines) - 2}"  # the first two lines are no assignments
+        lines.append(f"    {name} = {expression}")
+        stack.append(name)
+
+    for op, arg in compile_program(gen):
+        if op == RANDINT:
+            assign(f"randint({arg[0]}, {arg[1]})")
+        elif op == MAP:
+            assign(f"{konst(arg)}({stack.pop()})")
+        elif op == MAPN:
+            f, n = arg
+            args = stack[len(stack)-n:]
+            del stack[len(stack)-n:]
+            assign(f"{konst(f)}({', '.join(args)})")
+        elif op == CONST:
+            stack.append(konst(arg))
+        elif op == BIND:
+            assign(f"{konst(arg)}({stack.pop()}).generate(choose)")
+        else:  # CALL
+            assign(f"{konst(arg)}(choose)")
+    lines.append(f"    return {stack.pop()}")
+    exec("\n".join(lines), namespace)
+    return namespace["generate"]
+
+
+def shrink_int(value: int) -> tuple[int, ...]:
+    # a precomputed tuple, not a generator - no frame switch per candidate
+    return _shrink_abs(abs(value))
+
+
+# the candidates only depend on abs(value), compute them once
+@lru_cache(maxsize=1024)
+def _shrink_abs(value: int) -> tuple[int, ...]:
+    candidates = []
+    current = value - 1
     while current > 0:
-        yield current
+        candidates.append(current)
         current = current // 2
     if value != 0:
-        yield 0
+        candidates.append(0)
+    return tuple(candidates)
 
 
 Gen = Generator[T]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TestResult:
     is_success: bool
     arguments: Tuple[Any, ...]
@@ -114,42 +242,69 @@ def for_all(gen: Gen[T],
         else:
             return map(
                 lambda inner_out:
-                replace(inner_out, arguments=(value,) + inner_out.arguments),
+                TestResult(inner_out.is_success,
+                           (value,) + inner_out.arguments),
                 outcome)
     return bind(property_wrapper, gen)
 
 
-def shrink_candidates(choices: ChoiceSeq) -> Iterable[ChoiceSeq]:
+def shrink_candidates(choices: ChoiceSeq,
+                      start_i: int = 0) -> Iterable[tuple[int, ChoiceSeq]]:
     # this is part of the list shrinker from vintage.py!
-    for i, elem in enumerate(choices.history):
-        for smaller_elem in shrink_int(elem):
-            smaller_history = list(choices.history)
+    # yields the position which was made smaller together with the candidate
+    for i in range(start_i, len(choices.history)):
+        for smaller_elem in shrink_int(choices.history[i]):
+            smaller_history = choices.history[:]  # a memcpy
             smaller_history[i] = smaller_elem
-            yield ChoiceSeq(smaller_history)
+            yield i, ChoiceSeq(smaller_history)
 
 
 def test(property: Property):
-    def do_shrink(choices: ChoiceSeq) -> None:
-        for smaller_choice in shrink_candidates(choices):
-            try:
-                result = property.generate(smaller_choice)
-            except InvalidReplay:
+    # the property is run over and over again, compile it once
+    generate = compile_to_python(property)
+
+    # the property is deterministic given its choices, and the shrinker
+    # keeps revisiting the same histories - so only run it once per history
+    # (the raw bytes of a history are a cheap key)
+    @lru_cache(maxsize=10_000)
+    def run(history: bytes) -> tuple[Optional[TestResult], bytes]:
+        choices = ChoiceSeq(make_history(history))
+        try:
+            result = generate(choices)
+        except InvalidReplay:
+            return None, b""
+        return result, choices.replayed_prefix().history.tobytes()
+
+    # after a successful shrink we first keep on shrinking the same position;
+    # the positions before it have just been tried, no need to do that again
+    def do_shrink(choices: ChoiceSeq, start_i: int = 0) -> None:
+        for i, smaller_choice in shrink_candidates(choices, start_i):
+            if i != start_i and start_i > 0:
+                # the position can't be shrunk any further, but the change
+                # can make the earlier positions shrinkable again
+                do_shrink(choices)
+                return
+            result, prefix = run(smaller_choice.history.tobytes())
+            if result is None:
                 print("Shrinking: didn't work, invalid replay.")
                 continue
             if not result.is_success:
                 print(f"Shrinking: found smaller arguments {result.arguments}")
-                do_shrink(smaller_choice.replayed_prefix())
+                do_shrink(ChoiceSeq(make_history(prefix)), i)
                 break
             print(f"Shrinking: didn't work, smaller arguments {
                 result.arguments} passed the test")
         else:
+            if start_i > 0:
+                do_shrink(choices)
+                return
             choices.replay()
             print(f"Shrinking: gave up at arguments {
-                  property.generate(choices).arguments}")
+                  generate(choices).arguments}")
 
     for test_number in range(100):
         choices = ChoiceSeq()
-        result = property.generate(choices)
+        result = generate(choices)
         if not result.is_success:
             print(f"Fail: at test {test_number} with arguments {
                   result.arguments}.")
@@ -168,8 +323,11 @@ def list_of_length(n: int, gen: Gen[T]) -> Gen[list[T]]:
 
 
 def list_of(gen: Gen[T]) -> Gen[list[T]]:
-    length = int_between(0, 10)
-    return bind(lambda n: list_of_length(n, gen), length)
+    max_length = 10
+    length = int_between(0, max_length)
+    # build the generator for each length once, not again for every list
+    of_length = [list_of_length(n, gen) for n in range(max_length + 1)]
+    return bind(lambda n: of_length[n], length)
 
 
 wrong_sum = for_all(list_of(int_between(-10, 10)),
@@ -185,9 +343,21 @@ age = int_between(0, 100)
 
 letter = map(chr, int_between(ord('a'), ord('z')))
 
-simple_name = map("".join, list_of_length(6, letter))
 
-person = mapN(Person, (simple_name, age))
+def fixed_letters(length: int) -> Gen[str]:
+    # same choices as map("".join, list_of_length(length, letter)), without
+    # going through all the generic generators for every single letter
+    low, high = ord('a'), ord('z')
+
+    def generator(choose: ChoiceSeq) -> str:
+        randint = choose.randint
+        return "".join([chr(randint(low, high)) for _ in range(length)])
+    return Generator(generator)
+
+
+simple_name = fixed_letters(6)
+
+person = mapN(cached_person, (simple_name, age))
 
 lists_of_person = list_of(person)
 
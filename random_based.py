@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, replace
+from dataclasses import dataclass
 import random
+from string import ascii_lowercase
 from typing import (Any, Callable, Generic, Iterable,
                     Optional, Tuple, TypeVar, Union)
-from example import Person, is_valid, sort_by_age, wrong_sort_by_age
+from example import cached_person, is_valid, sort_by_age, wrong_sort_by_age
 
 T = TypeVar("T")
 U = TypeVar("U")
@@ -12,18 +13,42 @@ V = TypeVar("V")
 
 Size = int
 
-
-class SizeExceeded(Exception):
-    pass
+# Sizes are never negative. A generator returns EXCEEDED as its size when it
+# can't stay below the given minimal size - a lot cheaper than raising an
+# exception, the shrinker runs into this most of the time.
+EXCEEDED: Size = -1
 
 
 class Generator(Generic[T]):
+    __slots__ = ('generate',)
+    generate: Callable[[Optional[Size]], Tuple[T, Size]]
+
     def __init__(self,
                  generator: Callable[[Optional[Size]], Tuple[T, Size]]):
-        self._generator = generator
+        # store the callable itself, so gen.generate(size) is a single call
+        # (all generators below default to no size, so gen.generate() works)
+        self.generate = generator
+
+
+# random.randint is comparatively slow - draw the random numbers for each
+# range in batches and hand them out one by one. The batches are drawn ahead
+# of time, so reseed with seed below to get the same values again.
+_POOL_SIZE = 4096
+_pools: dict[tuple[int, int], list[int]] = {}
 
-    def generate(self, min_size: Optional[Size] = None) -> Tuple[T, Size]:
-        return self._generator(min_size)
+
+def _randint(low: int, high: int) -> int:
+    pool = _pools.get((low, high))
+    if not pool:
+        pool = _pools[(low, high)] = random.choices(range(low, high + 1),
+                                                    k=_POOL_SIZE)
+    return pool.pop()
+
+
+def seed(a: Any = None) -> None:
+    "random.seed(a), and throw away the random numbers drawn ahead of time"
+    random.seed(a)
+    _pools.clear()
 
 
 def sample(gen: Generator[T]) -> list[T]:
@@ -31,21 +56,21 @@ def sample(gen: Generator[T]) -> list[T]:
 
 
 def always(value: T) -> Generator[T]:
-    return Generator(lambda _: (value, 0))
+    return Generator(lambda _=None: (value, 0))
 
 
 constant = always
 pure = always
 
 
-# decrease_size can throw exception and short-circuits this way
+# decrease_size returns EXCEEDED and the generators short-circuit this way
 def decrease_size(prev_min_size: Optional[Size],
                   curr_min_size: Size) -> Optional[Size]:
     if prev_min_size is None:
         return None
     smaller = prev_min_size-curr_min_size
     if smaller < 0:
-        raise SizeExceeded(f"{prev_min_size=} {curr_min_size=} {smaller=}")
+        return EXCEEDED
     return smaller
 
 
@@ -56,29 +81,40 @@ def int_between(low: int, high: int) -> Generator[int]:
         else:
             return 1*i
 
-    def generator(prev_min_size: Optional[Size]):
-        value = random.randint(low, high)
+    def generator(prev_min_size: Optional[Size] = None):
+        value = _randint(low, high)
         curr_min_size = zig_zag(value)
-        decrease_size(prev_min_size, curr_min_size)
+        if decrease_size(prev_min_size, curr_min_size) == EXCEEDED:
+            return None, EXCEEDED
         return value, curr_min_size
     return Generator(generator)
 
 
 def map(f: Callable[[T], U], gen: Generator[T]) -> Generator[U]:
-    def generator(curr_min_size: Optional[Size]):
-        result, size = gen.generate(curr_min_size)
+    generate = gen.generate
+
+    def generator(curr_min_size: Optional[Size] = None):
+        result, size = generate(curr_min_size)
+        if size == EXCEEDED:
+            return None, EXCEEDED
         return f(result), size
     return Generator(generator)
 
 
 def mapN(f: Callable[..., T],
          gens: Iterable[Generator[Any]]) -> Generator[T]:
-    def generator(prev_min_size: Optional[Size]):
+    generates = tuple(gen.generate for gen in gens)
+
+    def generator(prev_min_size: Optional[Size] = None):
         results: list[Any] = []
         size_acc = 0
-        for gen in gens:
-            result, curr_min_size = gen.generate(prev_min_size)
+        for generate in generates:
+            result, curr_min_size = generate(prev_min_size)
+            if curr_min_size == EXCEEDED:
+                return None, EXCEEDED
             prev_min_size = decrease_size(prev_min_size, curr_min_size)
+            if prev_min_size == EXCEEDED:
+                return None, EXCEEDED
             results.append(result)
             size_acc += curr_min_size
         return f(*results), size_acc
@@ -86,16 +122,24 @@ def mapN(f: Callable[..., T],
 
 
 def bind(f: Callable[[T], Generator[U]], gen: Generator[T]) -> Generator[U]:
-    def generator(prev_min_size: Optional[Size]):
-        result, size_outer = gen.generate(prev_min_size)
+    generate = gen.generate
+
+    def generator(prev_min_size: Optional[Size] = None):
+        result, size_outer = generate(prev_min_size)
+        if size_outer == EXCEEDED:
+            return None, EXCEEDED
         min_size = decrease_size(prev_min_size, size_outer)
+        if min_size == EXCEEDED:
+            return None, EXCEEDED
         result, size_inner = f(result).generate(min_size)
+        if size_inner == EXCEEDED:
+            return None, EXCEEDED
         curr_min_size = size_inner+size_outer
         return result, curr_min_size
     return Generator(generator)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TestResult:
     is_success: bool
     arguments: Tuple[Any, ...]
@@ -113,32 +157,35 @@ def for_all(gen: Generator[T],
         else:
             return map(
                 lambda inner_out:
-                replace(inner_out,
-                        arguments=(value,) + inner_out.arguments), outcome)
+                TestResult(inner_out.is_success,
+                           (value,) + inner_out.arguments), outcome)
     return bind(property_wrapper, gen)
 
 
 def test(property: Property):
     def find_smaller(min_result: TestResult, min_size: Size):
-        skipped, not_shrunk, shrunk = 0, 0, 0
-        # try a 100000 times
-        while skipped + not_shrunk + shrunk <= 100_000 and min_size > 0:
-            try:
-                result, new_min_size = property.generate(min_size)
-                if new_min_size >= min_size:  # new value not interesting
-                    skipped += 1
-                elif not result.is_success:  # new_min_size is smaller
-                    shrunk += 1
-                    # in Python function arguments are passed by reference
-                    min_result, min_size = result, new_min_size
-                    print(f"Shrinking: found smaller arguments {
-                        result.arguments}")
-                else:
-                    not_shrunk += 1
-                    print(f"Shrinking: didn't work, smaller arguments {
-                        result.arguments} passed the test")
-            except SizeExceeded:  # can only happen in decrease_size
-                skipped += 1
+        # this loop runs up to 100000 times, so keep its body lean: a local
+        # generate, one counter for the tries (skipped follows from it) and
+        # a single comparison for the common case of a skipped value
+        generate = property.generate
+        tries, not_shrunk, shrunk = 0, 0, 0
+        while tries <= 100_000 and min_size > 0:
+            tries += 1
+            result, new_min_size = generate(min_size)
+            if not 0 <= new_min_size < min_size:
+                # EXCEEDED (from decrease_size) or not smaller: not interesting
+                continue
+            if not result.is_success:  # new_min_size is smaller
+                shrunk += 1
+                # in Python function arguments are passed by reference
+                min_result, min_size = result, new_min_size
+                print(f"Shrinking: found smaller arguments {
+                    result.arguments}")
+            else:
+                not_shrunk += 1
+                print(f"Shrinking: didn't work, smaller arguments {
+                    result.arguments} passed the test")
+        skipped = tries - not_shrunk - shrunk
 
         print(f"Shrinking: gave up at arguments {min_result.arguments}")
         print(f"{skipped=} {not_shrunk=} {shrunk=} {min_size=}")
@@ -166,8 +213,11 @@ def list_of_length(n: int, gen: Generator[T]) -> Generator[list[T]]:
 
 
 def list_of(gen: Generator[T]) -> Generator[list[T]]:
-    length = int_between(0, 10)
-    return bind(lambda n: list_of_length(n, gen), length)
+    max_length = 10
+    length = int_between(0, max_length)
+    # build the generator for each length once, not again for every list
+    of_length = [list_of_length(n, gen) for n in range(max_length + 1)]
+    return bind(lambda n: of_length[n], length)
 
 
 wrong_sum = for_all(list_of(int_between(-10, 10)), lambda lst:
@@ -186,9 +236,24 @@ age = int_between(0, 100)
 
 letter = map(chr, int_between(ord('a'), ord('z')))
 
-simple_name = map("".join, list_of_length(6, letter))
 
-person = mapN(Person, (simple_name, age))
+def fixed_letters(length: int) -> Generator[str]:
+    # same as map("".join, list_of_length(length, letter)), but all the
+    # letters are drawn at once
+    def generator(prev_min_size: Optional[Size] = None):
+        value = "".join(random.choices(ascii_lowercase, k=length))
+        # the size of a letter is its (positive) code, see zig_zag; as all
+        # sizes are positive, exceeding the sum means some prefix exceeded
+        curr_min_size = sum([ord(c) for c in value])
+        if decrease_size(prev_min_size, curr_min_size) == EXCEEDED:
+            return None, EXCEEDED
+        return value, curr_min_size
+    return Generator(generator)
+
+
+simple_name = fixed_letters(6)
+
+person = mapN(cached_person, (simple_name, age))
 
 lists_of_person = list_of(person)
 
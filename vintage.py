@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, replace
+from functools import lru_cache
 import math
 import random
-from typing import Any, Callable, Generic, Iterable, Tuple, TypeVar, Union
+from string import ascii_lowercase
+from typing import (Any, Callable, Generic, Iterable, NamedTuple, Tuple,
+                    TypeVar, Union)
 from example import Person, sort_by_age, wrong_sort_by_age, is_valid
 
 T = TypeVar("Value", covariant=True)
@@ -13,11 +15,12 @@ V = TypeVar("V")
 
 
 class Generator(Generic[T]):
-    def __init__(self, generate: Callable[[], T]):
-        self._generate = generate
+    __slots__ = ('generate',)
+    generate: Callable[[], T]
 
-    def generate(self) -> T:
-        return self._generate()
+    def __init__(self, generate: Callable[[], T]):
+        # store the callable itself, so gen.generate() is a single call
+        self.generate = generate
 
 
 def sample(gen: Generator[T]) -> list[T]:
@@ -33,46 +36,127 @@ pie = always(math.pi)
 pure = always
 
 
+# random.randint is comparatively slow - draw the random numbers for each
+# range in batches and hand them out one by one. The batches are drawn ahead
+# of time, so reseed with seed below to get the same values again.
+_POOL_SIZE = 4096
+_pools: dict[tuple[int, int], list[int]] = {}
+# the same for the strings of fixed_letters, per length
+_letter_pools: dict[int, list[str]] = {}
+
+
+def _randint(low: int, high: int) -> int:
+    pool = _pools.get((low, high))
+    if not pool:
+        pool = _pools[(low, high)] = random.choices(range(low, high + 1),
+                                                    k=_POOL_SIZE)
+    return pool.pop()
+
+
+def seed(a: Any = None) -> None:
+    "random.seed(a), and throw away the random values drawn ahead of time"
+    random.seed(a)
+    _pools.clear()
+    _letter_pools.clear()
+
+
 def int_between(low: int, high: int) -> Generator[int]:
-    return Generator(lambda: random.randint(low, high))
+    return Generator(lambda: _randint(low, high))
 
 
 age = int_between(0, 100)
 
 
 def map(f: Callable[[T], U], gen: Generator[T]) -> Generator[U]:
-    return Generator(lambda: f(gen.generate()))
+    generate = gen.generate
+    return Generator(lambda: f(generate()))
 
 
 letter = map(chr, int_between(ord('a'), ord('z')))
 
 
+# The number of generators is known when a generator is built, so the calls
+# can be spelled out instead of looping over the generators on every sample.
+# The code is generated once per number of generators.
+
+@lru_cache(maxsize=128)
+def _unrolled_call(n: int) -> Callable[..., Callable[[], Any]]:
+    # e.g. for n = 2: lambda f, g0, g1: lambda: f(g0(), g1())
+    generates = [f"g{i}" for i in range(n)]
+    return eval(f"lambda {', '.join(['f'] + generates)}: "
+                f"lambda: f({', '.join(g + '()' for g in generates)})")
+
+
+@lru_cache(maxsize=128)
+def _unrolled_list(n: int) -> Callable[..., Callable[[], list[Any]]]:
+    # e.g. for n = 3: lambda g: lambda: [g(), g(), g()]
+    return eval(f"lambda g: lambda: [{', '.join(['g()'] * n)}]")
+
+
 def mapN(f: Callable[..., T],
          gens: Iterable[Generator[Any]]) -> Generator[T]:
-    return Generator(lambda: f(*[gen.generate() for gen in gens]))
+    generates = tuple(gen.generate for gen in gens)
+    return Generator(_unrolled_call(len(generates))(f, *generates))
 
 
 def list_of_length(n: int, gen: Generator[T]) -> Generator[list[T]]:
     "n is the length of the lists"
-    return mapN(lambda *args: list(args), [gen] * n)
+    # the same as mapN(lambda *args: list(args), [gen] * n)
+    return Generator(_unrolled_list(n)(gen.generate))
 
 
-simple_name = map("".join, list_of_length(6, letter))
+def fixed_letters(length: int) -> Generator[str]:
+    # same as map("".join, list_of_length(length, letter)), but the letters of
+    # a whole batch of strings are drawn at once and then sliced up
+    if length == 0:
+        return always("")
+
+    def generate() -> str:
+        strings = _letter_pools.get(length)
+        if not strings:
+            letters = "".join(random.choices(ascii_lowercase,
+                                             k=length * _POOL_SIZE))
+            strings = _letter_pools[length] = [
+                letters[i:i+length] for i in range(0, len(letters), length)]
+        return strings.pop()
+    return Generator(generate)
+
+
+simple_name = fixed_letters(6)
 person = mapN(Person, (simple_name, age))
 
 
 def bind(f: Callable[[T], Generator[U]], gen: Generator[T]) -> Generator[U]:
-    return Generator(lambda: f(gen.generate()).generate())
+    generate = gen.generate
+    return Generator(lambda: f(generate()).generate())
+
+
+def bind_int(low: int, high: int,
+             f: Callable[[int], Generator[U]]) -> Generator[U]:
+    "bind(f, int_between(low, high)), but f is called only once per int"
+    # filled in on demand: f(i) is only built the first time i is drawn
+    generates: list[Callable[[], U] | None] = [None] * (high - low + 1)
+
+    def generate() -> U:
+        i = _randint(low, high) - low
+        gen_generate = generates[i]
+        if gen_generate is None:
+            gen_generate = generates[i] = f(i + low).generate
+        return gen_generate()
+    return Generator(generate)
 
 
 def list_of_random_length(gen: Generator[T]) -> Generator[list[T]]:
-    length = int_between(0, 10)
-    return bind(lambda length: list_of_length(length, gen), length)
+    # the same as bind(lambda length: list_of_length(length, gen),
+    #                  int_between(0, 10))
+    return bind_int(0, 10, lambda length: list_of_length(length, gen))
 
 
 def bindN(f: Callable[..., Generator[T]],
           gens: Iterable[Generator[Any]]) -> Generator[T]:
-    return Generator(lambda: f(*[gen.generate() for gen in gens]).generate())
+    generates = tuple(gen.generate for gen in gens)
+    return Generator(lambda: f(*[generate()
+                                 for generate in generates]).generate())
 
 
 list_of_person = list_of_length(2, person)
@@ -81,8 +165,9 @@ list_of_person_random_length = list_of_random_length(person)
 
 def choice(from_gens: Iterable[Generator[T]]) -> Generator[T]:
     all = tuple(from_gens)
-    which_gen = int_between(0, len(all)-1)
-    return bind(lambda i: all[i], which_gen)
+    # the same as bind(lambda i: all[i], int_between(0, len(all)-1)), but
+    # indexes the generators directly instead of going through bind
+    return bind_int(0, len(all)-1, lambda i: all[i])
 
 
 # A property is just a generator of booleans. The idea is we generate the bool
@@ -95,8 +180,8 @@ def for_all_1(gen: Generator[T], property: Callable[[T], bool]) -> Property1:
     return map(property, gen)
 
 
-rev_of_rev_1 = for_all_1(list_of_random_length(letter), lambda lst: list(
-    reversed(list(reversed(lst)))) == lst)
+rev_of_rev_1 = for_all_1(list_of_random_length(letter),
+                         lambda lst: lst[::-1][::-1] == lst)
 
 sort_by_age_1 = for_all_1(list_of_person_random_length,
                           lambda persons: is_valid(persons,
@@ -158,14 +243,14 @@ weird_sum_of_list = for_all_2(
         lambda lst: sum(e+i for e in lst) == sum(lst) + len(lst) * i))
 
 wrong_2 = for_all_2(list_of_random_length(letter),
-                    lambda lst: list(reversed(lst)) == lst)
+                    lambda lst: lst[::-1] == lst)
 
 # ok, but let's try to make it print on which values it failed - this needs a
 # change to for_all, and the type of property.
 
 
-@dataclass(frozen=True)
-class TestResult:
+# a NamedTuple is a tuple underneath: cheap to build and small in memory
+class TestResult(NamedTuple):
     is_success: bool
     arguments: Tuple[Any, ...]
 
@@ -181,14 +266,41 @@ def for_all(gen: Generator[T],
             return always(TestResult(is_success=outcome, arguments=(value,)))
         else:
             return map(
-                lambda inner_out: replace(
-                    inner_out,
-                    arguments=(value,) + inner_out.arguments),
+                lambda inner_out: TestResult(
+                    inner_out.is_success,
+                    (value,) + inner_out.arguments),
                 outcome)
     return bind(property_wrapper, gen)
 
 
+# If you know what the property returns, call one of these two directly:
+# they skip for_all's check of the outcome for every single value.
+
+# for_all for a property which returns a bool
+def for_all_leaf(gen: Generator[T],
+                 property: Callable[[T], bool]) -> Property:
+    return map(
+        lambda value: TestResult(is_success=property(value),
+                                 arguments=(value,)),
+        gen)
+
+
+# for_all for a property which returns a Property, i.e. an inner for_all
+def for_all_nested(gen: Generator[T],
+                   property: Callable[[T], Property]) -> Property:
+    def property_wrapper(value: T) -> Property:
+        return map(
+            lambda inner_out: TestResult(
+                inner_out.is_success,
+                (value,) + inner_out.arguments),
+            property(value))
+    return bind(property_wrapper, gen)
+
+
 def test(property: Property):
+    # the trials stay sequential: the properties are pure Python and hold
+    # the GIL, and all generators share the random module's state, so
+    # threads only add overhead and make failures harder to reproduce
     for test_number in range(100):
         result = property.generate()
         if not result.is_success:
@@ -198,28 +310,32 @@ def test(property: Property):
     print("Success: 100 tests passed.")
 
 
-wrong = for_all(list_of_random_length(letter),
-                lambda lst: list(reversed(lst)) == lst)
+# lst[::-1] reverses in a single C-level copy, unlike list(reversed(lst));
+# the properties which return a bool use for_all_leaf
+wrong = for_all_leaf(list_of_random_length(letter),
+                     lambda lst: lst[::-1] == lst)
 
-rev_of_rev = for_all(list_of_random_length(
-    letter), lambda lst: list(reversed(list(reversed(lst)))) == lst)
+rev_of_rev = for_all_leaf(list_of_random_length(letter),
+                          lambda lst: lst[::-1][::-1] == lst)
 
-sum_of_list = for_all(
+# for_all is like bind: every generated list is paired with a single i, so the
+# inner property runs once per list and sum(lst) isn't recomputed per i
+sum_of_list = for_all_nested(
     list_of_random_length(int_between(-10, 10)),
     lambda lst:
-    for_all(int_between(-10, 10),
-            lambda i:
-            sum(e+i for e in lst) == sum(lst) + len(lst) * i))
+    for_all_leaf(int_between(-10, 10),
+                 lambda i:
+                 sum(e+i for e in lst) == sum(lst) + len(lst) * i))
 
-prop_sort_by_age = for_all(list_of_person_random_length,
-                           lambda persons_in:
-                           is_valid(persons_in, sort_by_age(persons_in)))
+prop_sort_by_age = for_all_leaf(list_of_person_random_length,
+                                lambda persons_in:
+                                is_valid(persons_in, sort_by_age(persons_in)))
 
-prop_wrong_sort_by_age = for_all(list_of_person_random_length,
-                                 lambda persons_in:
-                                 is_valid(persons_in,
-                                          wrong_sort_by_age(persons_in)))
+prop_wrong_sort_by_age = for_all_leaf(list_of_person_random_length,
+                                      lambda persons_in:
+                                      is_valid(persons_in,
+                                               wrong_sort_by_age(persons_in)))
 
-prop_weird_shrink = for_all(
+prop_weird_shrink = for_all_leaf(
     int_between(-20, -1),
     lambda i: i * i < 0)
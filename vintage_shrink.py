@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Callable, Generic, Iterable, Protocol, TypeVar
+from functools import lru_cache, singledispatch
+from typing import (Any, Callable, Generic, Hashable, Iterable, Iterator,
+                    Optional, Protocol, TypeVar)
 
 from example import (Person, wrong_sort_by_age, is_valid)
 from vintage import (Generator, TestResult, int_between,
@@ -18,19 +19,35 @@ class Shrink(Protocol[T]):
         ...
 
 
-def shrink_int(value: int) -> Shrink[int]:
+def shrink_int(value: int) -> Iterable[int]:
+    return _shrink_int(abs(value))
+
+
+# the candidates only depend on abs(value) - compute them once, as a tuple
+@lru_cache(maxsize=1024)
+def _shrink_int(value: int) -> tuple[int, ...]:
+    candidates = []
     if value != 0:
-        yield 0
-    current = abs(value) // 2
+        candidates.append(0)
+    current = value // 2
     while current != 0:
-        yield abs(value) - current
+        candidates.append(value - current)
         current = current // 2
+    return tuple(candidates)
+
+
+# the candidates only depend on the letter, so look them up in a table
+_SHRINK_LETTER = {chr(i): tuple(candidate for candidate in ('a', 'b', 'c')
+                                if candidate < chr(i))
+                  for i in range(256)}
 
 
 def shrink_letter(value: str) -> Shrink[str]:
-    for candidate in ('a', 'b', 'c'):
-        if candidate < value:
-            yield candidate
+    try:
+        return _SHRINK_LETTER[value]
+    except KeyError:
+        return tuple(candidate for candidate in ('a', 'b', 'c')
+                     if candidate < value)
 
 
 def shrink_list(value: list[T], shrink_elem: Shrink[T]) -> Shrink[list[T]]:
@@ -49,10 +66,31 @@ def shrink_list(value: list[T], shrink_elem: Shrink[T]) -> Shrink[list[T]]:
                 yield smaller_list
 
 
-@dataclass(frozen=True)
 class CandidateTree(Generic[T]):
-    value: T
-    candidates: Iterable[CandidateTree[T]]
+    def __init__(self, value: T,
+                 candidates: Iterable[CandidateTree[T]]) -> None:
+        self.value = value
+        # The candidates are computed on demand - computing a candidate of a
+        # tree_map tree runs the property - and kept, so that the candidates
+        # can be iterated again without running shrink(value) again.
+        self._source: Optional[Iterator[CandidateTree[T]]] = iter(candidates)
+        self._computed: list[CandidateTree[T]] = []
+
+    @property
+    def candidates(self) -> Iterator[CandidateTree[T]]:
+        computed = self._computed
+        i = 0
+        while True:
+            if i == len(computed):
+                if self._source is None:
+                    return
+                candidate = next(self._source, None)
+                if candidate is None:
+                    self._source = None  # all candidates are computed
+                    return
+                computed.append(candidate)
+            yield computed[i]
+            i += 1
 
     def __str__(self, level=0):
         ret = "\t"*level+repr(self.value)+"\n"
@@ -71,6 +109,9 @@ def tree_from_shrink(value: T, shrink: Shrink[T]) -> CandidateTree[T]:
     )
 
 
+# tree_map stays lazy: a candidate and its value (for a property: the test)
+# are only computed once the candidate is visited, so the recursion only goes
+# one level deeper per visited candidate
 def tree_map(f: Callable[[T], U], tree: CandidateTree[T]) -> CandidateTree[U]:
     u = f(tree.value)
     branches_u = (tree_map(f, branch) for branch in tree.candidates)
@@ -80,16 +121,50 @@ def tree_map(f: Callable[[T], U], tree: CandidateTree[T]) -> CandidateTree[U]:
 Property = Generator[CandidateTree[TestResult]]
 
 
+# A hashable stand-in for a value, equal only for equal values of the same
+# type (1 == True and [1] == (1,) in Python, but the property might tell them
+# apart). Persons, ints and strings are hashable themselves.
+@singledispatch
+def cache_key(value: Any) -> Hashable:
+    return (type(value), value)
+
+
+@cache_key.register
+def _(value: list) -> Hashable:
+    return (list, tuple(cache_key(elem) for elem in value))
+
+
+@cache_key.register
+def _(value: tuple) -> Hashable:
+    return (type(value), tuple(cache_key(elem) for elem in value))
+
+
 def for_all(gen: Generator[T],
             shrink: Shrink[T],
             property: Callable[[T], bool]) -> Property:
+    # The shrinkers produce the same values again and again, e.g. the same
+    # prefixes of a list for different elements, so remember the results.
+    # A small cache already catches most of them. This also means all nodes
+    # with the same value share one TestResult and its arguments tuple, so
+    # the tree doesn't hold a fresh copy of the arguments per node.
+    results: dict[Hashable, TestResult] = {}
+    max_results = 4096
+
+    def test_value(v: T) -> TestResult:
+        key = cache_key(v)
+        try:
+            result = results.get(key)
+        except TypeError:  # unhashable, don't cache
+            return TestResult(is_success=property(v), arguments=(v,))
+        if result is None:
+            result = TestResult(is_success=property(v), arguments=(v,))
+            if len(results) < max_results:
+                results[key] = result
+        return result
 
     def property_wrapper(value: T) -> CandidateTree[TestResult]:
         search_tree = tree_from_shrink(value, shrink)
-        search_tree_test = tree_map(
-            lambda v: TestResult(is_success=property(v), arguments=(v,)),
-            search_tree
-        )
+        search_tree_test = tree_map(test_value, search_tree)
         return search_tree_test
 
     return map(property_wrapper, gen)
@@ -97,15 +172,19 @@ def for_all(gen: Generator[T],
 
 def test(property: Property):
     # 2. Shrinking
+    # a loop instead of recursion: one step per smaller failing candidate
     def do_shrink(tree: CandidateTree[TestResult]) -> None:
-        for smaller in tree.candidates:
-            if not smaller.value.is_success:
-                print(f"Shrinking: found smaller arguments {
-                      smaller.value.arguments}")
-                do_shrink(smaller)
+        while True:
+            for smaller in tree.candidates:
+                if not smaller.value.is_success:
+                    print(f"Shrinking: found smaller arguments {
+                          smaller.value.arguments}")
+                    tree = smaller
+                    break
+            else:
+                print(f"Shrinking: giving up - smallest arguments found {
+                      tree.value.arguments}")
                 return
-        print(f"Shrinking: giving up - smallest arguments found {
-              tree.value.arguments}")
 
     # 1. Exploration
     for test_number in range(100):
@@ -128,14 +207,25 @@ wrong_shrink_1 = for_all(
 wrong_shrink_2 = for_all(
     list_of_random_length(int_between(0, 10)),
     lambda lst1: shrink_list(lst1, shrink_int),
-    lambda lst2: list(reversed(lst2)) == lst2
+    lambda lst2: lst2[::-1] == lst2
 )
 
 
 def shrink_name(name: str) -> Iterable[str]:
-    name_as_list = list(name)
-    for smaller_list in shrink_list(name_as_list, shrink_letter):
-        yield "".join(smaller_list)
+    # the same candidates in the same order as shrink_list on list(name)
+    # joined back to strings - keep the two in sync - but slicing the string
+    # directly: no list copy and join for every candidate
+    length = len(name)
+    if length > 0:
+        yield ""
+        half_length = length // 2
+        while half_length != 0:
+            yield name[:half_length]
+            yield name[half_length:]
+            half_length = half_length // 2
+        for i, letter in enumerate(name):
+            for smaller_letter in shrink_letter(letter):
+                yield name[:i] + smaller_letter + name[i+1:]
 
 
 def shrink_person(value: Person) -> Iterable[Person]: